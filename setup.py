@@ -22,7 +22,7 @@ setuptools.setup(
         'psifr': ['data/*.csv']
     },
     install_requires=[
-        'numpy',
+        'numpy>=1.20',
         'scipy',
         'pandas>=1.0.0',
         'matplotlib!=3.3.1',
@@ -31,6 +31,7 @@ setuptools.setup(
     extras_require={
         'docs': ['sphinx', 'pydata-sphinx-theme', 'ipython'],
         'test': ['pytest', 'codecov', 'pytest-cov'],
+        'numba': ['numba'],
     },
     classifiers=[
         'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
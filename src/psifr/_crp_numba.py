@@ -0,0 +1,110 @@
+"""Compiled kernel for counting lag transitions."""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _accumulate(pool, pool_starts, recalls, recall_starts, list_length,
+                actual, possible):
+    """Add actual and possible lag counts for a set of lists."""
+    max_lag = list_length - 1
+    avail = np.zeros(list_length + 1, dtype=np.uint8)
+    for i in range(len(pool_starts) - 1):
+        # mark serial positions available for recall in this list
+        avail[:] = 0
+        for j in range(pool_starts[i], pool_starts[i + 1]):
+            avail[pool[j]] = 1
+
+        # position 0 codes intrusions and items outside the pool
+        for n in range(recall_starts[i], recall_starts[i + 1] - 1):
+            prev = recalls[n]
+            if avail[prev] == 0:
+                continue
+            avail[prev] = 0
+
+            curr = recalls[n + 1]
+            if avail[curr] == 0:
+                continue
+
+            # add availability of each position to the possible count
+            # for its lag, without branching on each position
+            actual[curr - prev + max_lag] += 1
+            start = max_lag - prev
+            for pos in range(1, list_length + 1):
+                possible[start + pos] += avail[pos]
+
+
+if numba is not None:
+    _accumulate = numba.njit(cache=True)(_accumulate)
+
+
+def serial_positions(values, list_length):
+    """Convert values to serial positions, with 0 for invalid values."""
+    values = np.asarray(values, dtype=float)
+    valid = (np.isfinite(values) & (values % 1 == 0) &
+             (values >= 1) & (values <= list_length))
+    positions = np.where(valid, values, 0).astype(np.int64)
+    return positions, valid
+
+
+def _flatten_positions(lists, list_length):
+    """Concatenate serial position lists and get the start of each."""
+    starts = np.zeros(len(lists) + 1, dtype=np.int64)
+    starts[1:] = np.cumsum([len(x) for x in lists])
+    flat = np.zeros(starts[-1], dtype=float)
+    for i, x in enumerate(lists):
+        flat[starts[i]:starts[i + 1]] = x
+    positions, valid = serial_positions(flat, list_length)
+    return positions, starts, valid
+
+
+def count_lags(list_length, pool_items, recall_items, actual, possible):
+    """
+    Add counts of actual and possible serial position lags.
+
+    Parameters
+    ----------
+    list_length : int
+        Number of items in each list.
+
+    pool_items : list
+        List of the serial positions available for recall in each list.
+
+    recall_items : list
+        List indicating the serial position of each recall in output
+        order (NaN for intrusions).
+
+    actual : numpy.ndarray
+        Count of actual transitions for each lag from -(list_length - 1)
+        to list_length - 1. Will be updated in place.
+
+    possible : numpy.ndarray
+        Count of possible transitions for each lag. Will be updated in
+        place.
+
+    Returns
+    -------
+    counted : bool
+        False if the pool includes values that are not valid serial
+        positions or includes repeated positions within a list; in that
+        case, the counts are not changed.
+    """
+    list_length = int(list_length)
+    pool, pool_starts, pool_valid = _flatten_positions(pool_items,
+                                                       list_length)
+    if not pool_valid.all():
+        return False
+
+    # each position can only be marked available once in a list
+    pool_list = np.repeat(np.arange(len(pool_items)), np.diff(pool_starts))
+    pool_keys = pool_list * (list_length + 1) + pool
+    if len(np.unique(pool_keys)) < len(pool_keys):
+        return False
+    recalls, recall_starts, _ = _flatten_positions(recall_items, list_length)
+    _accumulate(pool, pool_starts, recalls, recall_starts, list_length,
+                actual, possible)
+    return True
@@ -22,6 +22,82 @@ def _match_values(series, values):
     return include
 
 
+def _key_values(frames, key):
+    """Get values of a column from multiple frames as one array."""
+    if all(isinstance(frame[key].dtype, pd.CategoricalDtype)
+           for frame in frames):
+        # keep categorical values, which sort in category order
+        return pd.concat([frame[key] for frame in frames], ignore_index=True)
+
+    # taking the values from the underlying arrays avoids converting
+    # missing values in extension arrays
+    return np.concatenate([np.asarray(frame[key].array) for frame in frames])
+
+
+def _key_codes(frames, keys, codes=None):
+    """
+    Get integer codes for unique combinations of key values.
+
+    Codes are shared across all frames, so that rows with the same key
+    values in different frames will have the same code. Codes are
+    numbered in sorted order of the key values (category order for
+    categorical keys), with missing values last. If existing codes are given, they will be combined with the
+    keys, taking precedence in the sort order.
+    """
+    if codes is None:
+        codes = np.zeros(sum(len(frame) for frame in frames), dtype=np.int64)
+    n_code = codes.max() + 1 if len(codes) > 0 else 0
+
+    for key in keys:
+        key_codes, uniques = pd.factorize(_key_values(frames, key),
+                                          sort=True)
+        key_codes[key_codes < 0] = len(uniques)
+        if n_code * (len(uniques) + 1) >= 2 ** 62:
+            # renumber to avoid overflow when combining codes
+            codes = pd.factorize(codes, sort=True)[0]
+            n_code = codes.max() + 1
+        codes = codes * (len(uniques) + 1) + key_codes + 1
+        n_code *= len(uniques) + 1
+
+    # renumber so that codes are consecutive
+    codes = pd.factorize(codes, sort=True)[0]
+    return codes
+
+
+def _first_index(codes):
+    """Get the index of the first occurrence of each code."""
+    n_code = codes.max() + 1 if len(codes) > 0 else 0
+    first = np.full(n_code, len(codes), dtype=np.int64)
+    np.minimum.at(first, codes, np.arange(len(codes)))
+    return first
+
+
+def _running_count(codes):
+    """Get running count of each code."""
+    # sort rows into groups, preserving order within each group
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+
+    # count from the start of each group
+    n = len(codes)
+    index = np.arange(n)
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = sorted_codes[1:] != sorted_codes[:-1]
+    group_start = np.maximum.accumulate(np.where(is_start, index, 0))
+    count = np.empty(n, dtype=int)
+    count[order] = index - group_start
+    return count
+
+
+def _recall_repeats(recall, merge_keys, codes):
+    """Get running count of recalls of each item within each list."""
+    # recalls with missing key values are not grouped, so are not
+    # counted as repeats
+    repeat = _running_count(codes)
+    repeat[recall[merge_keys].isna().any(axis=1).to_numpy()] = 0
+    return repeat
+
+
 def filter_data(data, subjects=None, lists=None, trial_type=None, positions=None,
                 inputs=None, outputs=None):
     """Filter data to get a subset of trials."""
@@ -84,14 +160,11 @@ def check_data(df):
 def block_index(list_labels):
     """Get index of each block in a list."""
 
-    prev_label = ''
-    curr_block = 0
-    block = np.zeros(len(list_labels), dtype=int)
-    for i, label in enumerate(list_labels):
-        if prev_label != label:
-            curr_block += 1
-        block[i] = curr_block
-        prev_label = label
+    # a new block starts whenever the label changes
+    codes = pd.factorize(np.asarray(list_labels))[0]
+    changed = np.ones(len(codes), dtype=bool)
+    changed[1:] = codes[1:] != codes[:-1]
+    block = np.cumsum(changed, dtype=int)
     return block
 
 
@@ -116,12 +189,13 @@ def split_lists(frame, phase, keys, names=None, item_query=None, as_list=False):
 
     unique_lists = frame['list'].unique()
     if phase == 'study':
-        phase_data = frame.loc[frame['study']]
+        phase_data = frame.loc[frame['study']].sort_values(
+            'list', kind='mergesort')
     elif phase == 'recall':
         phase_data = frame.loc[frame['recall']].sort_values(
             ['list', 'output'])
     elif phase == 'raw':
-        phase_data = frame
+        phase_data = frame.sort_values('list', kind='mergesort')
     else:
         raise ValueError(f'Invalid phase: {phase}')
 
@@ -131,7 +205,14 @@ def split_lists(frame, phase, keys, names=None, item_query=None, as_list=False):
     else:
         mask = np.ones(phase_data.shape[0], dtype=bool)
 
-    frame_idx = phase_data.reset_index().groupby('list').indices
+    # rows are sorted by list, so each list is a contiguous run
+    list_values = phase_data['list'].to_numpy()
+    is_start = np.ones(len(list_values), dtype=bool)
+    is_start[1:] = list_values[1:] != list_values[:-1]
+    starts = np.flatnonzero(is_start)
+    stops = np.append(starts[1:], len(list_values))
+    frame_idx = {list_values[start]: slice(start, stop)
+                 for start, stop in zip(starts, stops)}
     for key, name in zip(keys, names):
         if key is None or key not in frame.columns:
             split[name] = None
@@ -165,6 +246,181 @@ def merge_free_recall(data, **kwargs):
     return merged
 
 
+def _outer_join(left_codes, right_codes):
+    """
+    Get rows matched by an outer join on consecutive integer codes.
+
+    Rows are ordered by code; rows with the same code are ordered as
+    in a pandas join, by left row and then right row. Rows without a
+    match are indicated by -1.
+    """
+    n_code = max(left_codes.max(initial=-1), right_codes.max(initial=-1)) + 1
+    left_count = np.bincount(left_codes, minlength=n_code)
+    right_count = np.bincount(right_codes, minlength=n_code)
+    left_order = np.argsort(left_codes, kind='stable')
+    right_order = np.argsort(right_codes, kind='stable')
+    left_start = np.cumsum(left_count) - left_count
+    right_start = np.cumsum(right_count) - right_count
+
+    # each code has a row for each pair of matching rows, or for each
+    # row if there are no matches
+    n_left = np.maximum(left_count, 1)
+    n_right = np.maximum(right_count, 1)
+    n_row = n_left * n_right
+    codes = np.repeat(np.arange(n_code), n_row)
+    offset = np.arange(n_row.sum()) - np.repeat(np.cumsum(n_row) - n_row,
+                                                 n_row)
+    left_ind, right_ind = np.divmod(offset, n_right[codes])
+
+    left_rows = np.full(len(codes), -1, dtype=np.int64)
+    has_left = left_count[codes] > 0
+    left_rows[has_left] = left_order[
+        left_start[codes[has_left]] + left_ind[has_left]]
+    right_rows = np.full(len(codes), -1, dtype=np.int64)
+    has_right = right_count[codes] > 0
+    right_rows[has_right] = right_order[
+        right_start[codes[has_right]] + right_ind[has_right]]
+    return codes, left_rows, right_rows
+
+
+def _sort_order(group_codes, positions, codes=None):
+    """
+    Get order of rows by group and then position.
+
+    Missing positions sort last within each group. Ties are ordered by
+    codes, if specified, and otherwise keep their current order.
+    """
+    if codes is None:
+        return np.lexsort((positions, group_codes))
+    return np.lexsort((codes, positions, group_codes))
+
+
+def _merge_events(study, recall, merge_keys, list_keys, study_keys,
+                  recall_keys, position_key, group_keys):
+    """Merge study and recall events with an outer join."""
+    # encode the keys as integer codes shared by study and recall events;
+    # merge codes are built on the group codes, so that each key is only
+    # encoded once
+    n_study = len(study)
+    group_codes = _key_codes([study, recall], group_keys)
+    merge_codes = _key_codes([study, recall], ['item'], group_codes)
+
+    # list keys usually have the same values for all events with the
+    # same merge keys, and then do not need to be encoded
+    first_index = _first_index(merge_codes)
+    first_rows = first_index[merge_codes]
+    for key in list_keys:
+        values = np.asarray(_key_values([study, recall], key))
+        if not np.array_equal(values, values[first_rows]):
+            join_codes = _key_codes([study, recall], list_keys, merge_codes)
+            first_index = _first_index(join_codes)
+            break
+    else:
+        join_codes = merge_codes
+
+    # get running count of number of times each item is recalled in each list
+    recall = recall.assign(
+        repeat=_recall_repeats(recall, merge_keys, merge_codes[n_study:])
+    )
+
+    # get key values for each code
+    join_keys = merge_keys + list_keys
+    key_values = pd.concat([study[join_keys], recall[join_keys]],
+                           ignore_index=True)
+    key_values = key_values.take(first_index)
+    join_groups = group_codes[first_index]
+
+    # match study and recall events with the same key codes, and sort by
+    # group and input position, keeping the join order of ties
+    codes, study_rows, recall_rows = _outer_join(join_codes[:n_study],
+                                                 join_codes[n_study:])
+    inputs = pd.api.extensions.take(study[position_key].to_numpy(),
+                                    study_rows, allow_fill=True)
+    order = _sort_order(join_groups[codes], inputs)
+    codes = codes[order]
+    study_rows = study_rows[order]
+    recall_rows = recall_rows[order]
+
+    # get fields from the matching events, with missing values for
+    # unmatched events, and then look up the key values
+    study = study[['position'] + study_keys].reset_index(drop=True)
+    recall = recall[['repeat', 'position'] + recall_keys].reset_index(
+        drop=True)
+    study = study.reindex(study_rows).reset_index(drop=True)
+    recall = recall.reindex(recall_rows).reset_index(drop=True)
+    merged = study.join(recall, lsuffix='_x', rsuffix='_y')
+    keys = key_values.take(codes).reset_index(drop=True)
+    merged = pd.concat([keys, merged], axis=1)
+
+    # position from study events indicates input position;
+    # position from recall events indicates output position
+    merged = merged.rename(columns={position_key + '_x': 'input',
+                                    position_key + '_y': 'output'})
+
+    # fix repeats field to define for non-recalled items
+    merged['repeat'] = merged['repeat'].fillna(0).astype(int)
+    return merged
+
+
+def _merge_default(study, recall, position_key):
+    """
+    Merge study and recall events using the default merge keys.
+
+    Each recall event is matched directly to the study event with the
+    same subject, list, and item. Returns None if any list has repeated
+    study items, which require a full outer join.
+    """
+    merge_keys = ['subject', 'list', 'item']
+    n_study = len(study)
+    n_recall = len(recall)
+    group_codes = _key_codes([study, recall], ['subject', 'list'])
+    codes = _key_codes([study, recall], ['item'], group_codes)
+    study_codes = codes[:n_study]
+    recall_codes = codes[n_study:]
+
+    # get the study event for each code (-1 if not studied)
+    n_code = codes.max() + 1 if len(codes) > 0 else 0
+    study_index = np.full(n_code, -1, dtype=np.int64)
+    study_index[study_codes] = np.arange(n_study)
+    if np.count_nonzero(study_index >= 0) < n_study:
+        return None
+
+    # one row for each recall event, plus each study event that was not
+    # recalled
+    recall_study = study_index[recall_codes]
+    recalled = np.zeros(n_study, dtype=bool)
+    recalled[recall_study[recall_study >= 0]] = True
+    not_recalled = np.flatnonzero(~recalled)
+    study_rows = np.concatenate([recall_study, not_recalled])
+    recall_rows = np.concatenate(
+        [np.arange(n_recall), np.full(len(not_recalled), -1)]
+    )
+    key_rows = np.concatenate([np.arange(n_recall) + n_study, not_recalled])
+
+    # sort by list and input position; ties are ordered by key, as in a
+    # sorted join
+    take = pd.api.extensions.take
+    inputs = take(study[position_key].to_numpy(), study_rows,
+                  allow_fill=True)
+    order = _sort_order(group_codes[key_rows], inputs, codes[key_rows])
+    study_rows = study_rows[order]
+    recall_rows = recall_rows[order]
+    key_rows = key_rows[order]
+
+    # get fields from the matching events, with missing values for
+    # unmatched events
+    keys = pd.concat([study[merge_keys], recall[merge_keys]],
+                     ignore_index=True)
+    merged = keys.take(key_rows).reset_index(drop=True)
+    merged['input'] = inputs[order]
+    merged['output'] = take(recall[position_key].to_numpy(), recall_rows,
+                            allow_fill=True)
+    repeat = _recall_repeats(recall, merge_keys, recall_codes)
+    merged['repeat'] = take(repeat, recall_rows, allow_fill=True,
+                            fill_value=0)
+    return merged
+
+
 def merge_lists(study, recall, merge_keys=None, list_keys=None, study_keys=None,
                 recall_keys=None, position_key='position'):
     """
@@ -239,50 +495,38 @@ def merge_lists(study, recall, merge_keys=None, list_keys=None, study_keys=None,
     if recall_keys is None:
         recall_keys = []
 
-    # get running count of number of times each item is recalled in each list
-    recall = recall.copy()
-    recall.loc[:, 'repeat'] = recall.groupby(merge_keys).cumcount()
+    # rows are sorted by the merge keys other than item, and then by
+    # input position
+    group_keys = merge_keys.copy()
+    group_keys.remove('item')
 
-    # get just the fields to use in the merge
-    study = study.copy()
-    study = study[merge_keys + ['position'] + list_keys + study_keys]
-    recall = recall[merge_keys + ['repeat', 'position'] + list_keys +
-                    recall_keys]
+    merged = None
+    if (merge_keys == ['subject', 'list', 'item'] and not list_keys
+            and not study_keys and not recall_keys):
+        # no other columns to carry over, so can match events directly
+        merged = _merge_default(study, recall, position_key)
 
-    # merge information from study and recall trials
-    merged = pd.merge(study, recall, left_on=merge_keys + list_keys,
-                      right_on=merge_keys + list_keys, how='outer')
-
-    # position from study events indicates input position;
-    # position from recall events indicates output position
-    merged = merged.rename(columns={position_key + '_x': 'input',
-                                    position_key + '_y': 'output'})
-
-    # fix repeats field to define for non-recalled items
-    merged.loc[merged['repeat'].isna(), 'repeat'] = 0
-    merged = merged.astype({'repeat': 'int'})
+    if merged is None:
+        merged = _merge_events(study, recall, merge_keys, list_keys,
+                               study_keys, recall_keys, position_key,
+                               group_keys)
 
     # field to indicate unique study events
-    merged.loc[:, 'study'] = merged['input'].notna() & (merged['repeat'] == 0)
+    studied = merged['input'].notna().to_numpy()
+    merged['study'] = studied & (merged['repeat'].to_numpy() == 0)
 
     # TODO: deal with repeats in the study list
     # field to indicate unique recall events
-    merged.loc[:, 'recall'] = merged['output'].notna()
+    merged['recall'] = merged['output'].notna().to_numpy()
 
     # field to indicate whether a given recall was an intrusion
-    merged.loc[:, 'intrusion'] = merged['input'].isna()
+    merged['intrusion'] = ~studied
 
     # reorder columns
     columns = (merge_keys + ['input', 'output'] +
                ['study', 'recall', 'repeat', 'intrusion'] +
                list_keys + study_keys + recall_keys)
     merged = merged.reindex(columns=columns)
-
-    # sort rows in standard order
-    sort_keys = merge_keys.copy() + ['input']
-    sort_keys.remove('item')
-    merged = merged.sort_values(by=sort_keys, ignore_index=True)
-
     return merged
 
 
@@ -2,9 +2,11 @@
 
 import abc
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy import stats
 import pandas as pd
 from psifr import fr
+from psifr import _crp_numba
 
 
 def percentile_rank(actual, possible):
@@ -18,6 +20,15 @@ def percentile_rank(actual, possible):
     return rank[0]
 
 
+def _divide_counts(actual, possible):
+    """Get probability from counts, with NaN where nothing was possible."""
+    actual = np.asarray(actual)
+    possible = np.asarray(possible)
+    prob = np.divide(actual, possible, out=np.full(actual.shape, np.nan),
+                     where=possible != 0)
+    return prob
+
+
 def outputs_masker(pool_items, recall_items, pool_output, recall_output,
                    pool_test=None, recall_test=None, test=None):
     """
@@ -61,10 +72,11 @@ def outputs_masker(pool_items, recall_items, pool_output, recall_output,
     output : int
         Current output position.
     """
-    pool_items = pool_items.copy()
-    pool_output = pool_output.copy()
+    # items are removed from copies of the pool as they are recalled
+    pool_items = list(pool_items)
+    pool_output = list(pool_output)
     if test is not None:
-        pool_test = pool_test.copy()
+        pool_test = list(pool_test)
 
     n = 0
     output = 0
@@ -193,7 +205,8 @@ def transitions_masker(pool_items, recall_items, pool_output, recall_output,
     ----------
     pool_items : list
         Items available for recall. Order does not matter. May contain
-        repeated values. Item identifiers must be unique within pool.
+        repeated values; each recall of a repeated item removes one
+        copy from the pool.
 
     recall_items : list
         Recalled items in output position order.
@@ -228,47 +241,74 @@ def transitions_masker(pool_items, recall_items, pool_output, recall_output,
         Output value for the "to" item.
 
     poss : numpy.array
-        Output values for all possible valid "to" items.
+        Output values for all possible valid "to" items. This may be a
+        view of a buffer that is reused for each transition; copy it if
+        it is needed after the next iteration.
     """
 
-    n = 0
-    pool_items = pool_items.copy()
-    pool_output = pool_output.copy()
+    # map each item to the indices of its copies in the pool, with the
+    # first copy last so that copies are removed in pool order, and
+    # track which items are still available for recall
+    pool_index = {}
+    for i in range(len(pool_items) - 1, -1, -1):
+        pool_index.setdefault(pool_items[i], []).append(i)
+    avail = np.ones(len(pool_items), dtype=bool)
+    n_avail = len(pool_items)
+    pool_output = np.asarray(pool_output)
+
+    # possible outputs are written to a buffer allocated once
+    scratch = np.empty(len(pool_output), dtype=pool_output.dtype)
+
     if test is not None:
-        pool_test = pool_test.copy()
+        # keep test values and outputs for remaining items, without
+        # gathering them again after each removal; removed items are
+        # masked out and only compacted after half have been removed
+        live_test = np.asarray(pool_test)
+        live_output = pool_output
+        live_ids = np.arange(len(pool_items))
+        live_avail = np.ones(len(pool_items), dtype=bool)
+        live_index = np.arange(len(pool_items))
 
+    n = 0
     while n < len(recall_items) - 1:
         # test if the previous item is in the pool
-        if recall_items[n] not in pool_items:
+        prev_copies = pool_index.get(recall_items[n])
+        if not prev_copies:
             n += 1
             continue
 
         # remove the item from the pool
-        ind = pool_items.index(recall_items[n])
-        del pool_items[ind]
-        del pool_output[ind]
+        prev_ind = prev_copies.pop()
+        avail[prev_ind] = False
+        n_avail -= 1
         if test is not None:
-            del pool_test[ind]
+            live_avail[live_index[prev_ind]] = False
+            if n_avail * 2 < len(live_ids):
+                live_test = live_test[live_avail]
+                live_output = live_output[live_avail]
+                live_ids = live_ids[live_avail]
+                live_avail = np.ones(len(live_ids), dtype=bool)
+                live_index[live_ids] = np.arange(len(live_ids))
 
         # test if the current item is in the pool
-        if recall_items[n + 1] not in pool_items:
+        if not pool_index.get(recall_items[n + 1]):
+            n += 1
+            continue
+
+        # test if this transition is included
+        if test is not None and not test(recall_test[n], recall_test[n + 1]):
             n += 1
             continue
 
         prev = recall_output[n]
         curr = recall_output[n + 1]
-        poss = np.array(pool_output)
-        if test is not None:
-            # test if this transition is included
-            if not test(recall_test[n], recall_test[n + 1]):
-                n += 1
-                continue
-
+        if test is None:
+            poss = scratch[:n_avail]
+            np.compress(avail, pool_output, out=poss)
+        else:
             # get included possible items
-            ind = test(recall_test[n], np.array(pool_test))
-            if not isinstance(ind, np.ndarray):
-                ind = np.repeat(ind, poss.shape)
-            poss = poss[ind]
+            ind = np.asarray(test(recall_test[n], live_test), dtype=bool)
+            poss = live_output[ind & live_avail]
         n += 1
         yield prev, curr, poss
 
@@ -312,14 +352,44 @@ def count_lags(list_length, pool_items, recall_items,
         if a given transition should be included.
     """
 
+    max_lag = int(list_length) - 1
+    actual = np.zeros(2 * max_lag + 1, dtype=int)
+    possible = np.zeros(2 * max_lag + 1, dtype=int)
+    _count_lags(list_length, pool_items, recall_items, pool_label,
+                recall_label, pool_test, recall_test, test, actual, possible)
+
+    lags = np.arange(-(list_length - 1), list_length)
+    actual = pd.Series(actual, index=lags)
+    possible = pd.Series(possible, index=lags)
+    return actual, possible
+
+
+def _count_lags(list_length, pool_items, recall_items, pool_label,
+                recall_label, pool_test, recall_test, test, actual, possible):
+    """Add actual and possible lag counts to existing count arrays."""
+    if pool_label is None and recall_label is None:
+        # count directly from serial positions, using the compiled
+        # kernel if available
+        if _crp_numba.numba is not None and test is None:
+            counted = _crp_numba.count_lags(list_length, pool_items,
+                                            recall_items, actual, possible)
+        else:
+            counted = _count_position_lags(list_length, pool_items,
+                                           recall_items, actual, possible,
+                                           pool_test, recall_test, test)
+        if counted:
+            return
+
     if pool_label is None:
         pool_label = pool_items
 
     if recall_label is None:
         recall_label = recall_items
 
-    list_actual = []
-    list_possible = []
+    # counts are indexed by lag offset so that the most negative lag is
+    # at zero
+    max_lag = int(list_length) - 1
+    n_lag = 2 * max_lag + 1
     for i, recall_items_list in enumerate(recall_items):
         # set up masker to filter transitions
         pool_test_list = None if pool_test is None else pool_test[i]
@@ -329,18 +399,111 @@ def count_lags(list_length, pool_items, recall_items,
                                     pool_test_list, recall_test_list, test)
 
         for prev, curr, poss in masker:
-            # for this step, calculate actual lag and all possible lags
-            list_actual.append(curr - prev)
-            list_possible.extend(poss - prev)
+            # for this step, calculate actual lag and all possible lags;
+            # lags outside the range for the list length are not counted
+            prev = int(prev)
+            offset = int(curr) - prev + max_lag
+            if 0 <= offset < n_lag:
+                actual[offset] += 1
+            offsets = poss.astype(int) - prev + max_lag
+            offsets = offsets[(offsets >= 0) & (offsets < n_lag)]
+            possible += np.bincount(offsets, minlength=n_lag)
+
 
-    # count the actual and possible transitions for each lag
+def _count_position_lags(list_length, pool_items, recall_items, actual,
+                         possible, pool_test=None, recall_test=None,
+                         test=None):
+    """
+    Add lag counts for lists where items are serial positions.
+
+    If specified, test must accept arrays for both the previous and
+    current test values. Returns False, without changing the counts, if
+    any pool item is not a valid serial position, if any list has
+    repeated positions in the pool, or if test does not return a result
+    for each transition.
+    """
+    list_length = int(list_length)
+    pools = []
+    for pool_items_list in pool_items:
+        pool, valid = _crp_numba.serial_positions(pool_items_list,
+                                                  list_length)
+        if not valid.all() or len(np.unique(pool)) < len(pool):
+            return False
+        pools.append(pool)
+    recalls_lists = [_crp_numba.serial_positions(x, list_length)[0]
+                     for x in recall_items]
+
+    # buffers are allocated once and reused for each list
     max_lag = list_length - 1
-    lags = np.arange(-max_lag, max_lag + 2)
-    actual = pd.Series(np.histogram(list_actual, lags)[0],
-                       index=lags[:-1])
-    possible = pd.Series(np.histogram(list_possible, lags)[0],
-                         index=lags[:-1])
-    return actual, possible
+    n_lag = 2 * max_lag + 1
+    list_actual = np.zeros(n_lag, dtype=int)
+    list_possible = np.zeros(n_lag, dtype=int)
+    in_pool = np.zeros(list_length + 1, dtype=bool)
+    avail = np.zeros(list_length + 1, dtype=bool)
+    first_output = np.zeros(list_length + 1, dtype=int)
+    steps = np.arange(max([len(x) for x in recalls_lists], default=0))
+    for i, (pool, recalls) in enumerate(zip(pools, recalls_lists)):
+        n_recall = len(recalls)
+        if n_recall < 2:
+            continue
+
+        # recalls count only if in the pool and not recalled before
+        in_pool[:] = False
+        in_pool[pool] = True
+        first_output[:] = n_recall
+        np.minimum.at(first_output, recalls, steps[:n_recall])
+        is_first = first_output[recalls] == steps[:n_recall]
+        include = in_pool[recalls] & is_first
+
+        # transitions are included if both recalls are included
+        prev = recalls[:-1]
+        curr = recalls[1:]
+        valid = include[:-1] & include[1:]
+        if not valid.any():
+            continue
+
+        if test is not None:
+            # test all valid transitions in one call
+            pool_values = np.asarray(pool_test[i])
+            recall_values = np.asarray(recall_test[i])
+            pairs = sliding_window_view(recall_values, 2)
+            try:
+                passed = np.asarray(test(pairs[valid, 0], pairs[valid, 1]))
+            except (TypeError, ValueError):
+                return False
+            if passed.shape != (np.count_nonzero(valid),):
+                return False
+            valid[valid] = passed
+
+            # pool test values by position; other positions are never
+            # available, so any pool value can be used as filler
+            position_values = np.empty(list_length + 1,
+                                       dtype=pool_values.dtype)
+            position_values[:] = pool_values[0]
+            position_values[pool] = pool_values
+        list_actual += np.bincount(curr[valid] - prev[valid] + max_lag,
+                                   minlength=n_lag)
+
+        # items are removed from the pool after each included recall;
+        # possible lags for positions 1 to list_length are a contiguous
+        # range of the count array, so availability can be added directly
+        avail[:] = in_pool
+        for n in np.flatnonzero(include[:-1]):
+            avail[prev[n]] = False
+            if not valid[n]:
+                continue
+
+            start = max_lag + 1 - prev[n]
+            if test is None:
+                list_possible[start:start + list_length] += avail[1:]
+            else:
+                ind = test(recall_values[n], position_values[1:])
+                list_possible[start:start + list_length] += (
+                    avail[1:] & np.asarray(ind, dtype=bool))
+
+    actual += list_actual
+    possible += list_possible
+    return True
 
 
 def rank_lags(pool_items, recall_items, pool_label=None, recall_label=None,
@@ -599,8 +762,7 @@ class TransitionMeasure(object):
         """Get relevant fields and split by list."""
         names = list(self.keys.keys())
         keys = list(self.keys.values())
-        split = fr.split_lists(data, phase, keys, names, self.item_query,
-                               as_list=True)
+        split = fr.split_lists(data, phase, keys, names, self.item_query)
         return split
 
     @abc.abstractmethod
@@ -633,8 +795,7 @@ class TransitionOutputs(TransitionMeasure):
         )
         inputs = np.tile(np.arange(1, actual.shape[1] + 1), actual.shape[0])
         outputs = np.repeat(np.arange(1, actual.shape[0] + 1), actual.shape[1])
-        with np.errstate(divide='ignore', invalid='ignore'):
-            prob = actual.flatten() / possible.flatten()
+        prob = _divide_counts(actual.flatten(), possible.flatten())
         pnr = pd.DataFrame(
             {'subject': subject, 'input': inputs, 'output': outputs,
              'prob': prob, 'actual': actual.flatten(),
@@ -651,18 +812,46 @@ class TransitionLag(TransitionMeasure):
                          test_key=test_key, test=test)
         self.list_length = list_length
 
-    def analyze_subject(self, subject, pool, recall):
-
-        actual, possible = count_lags(self.list_length,
-                                      pool['items'], recall['items'],
-                                      pool['label'], recall['label'],
-                                      pool['test'], recall['test'], self.test)
-        crp = pd.DataFrame({'subject': subject, 'lag': actual.index,
-                            'prob': actual / possible,
-                            'actual': actual, 'possible': possible})
+    def _count_subject(self, pool, recall, actual, possible):
+        """Add lag counts for one subject to existing count arrays."""
+        # lag is calculated from the item positions themselves
+        _count_lags(self.list_length, pool['items'], recall['items'],
+                    None, None, pool['test'], recall['test'], self.test,
+                    actual, possible)
+
+    def _lag_frame(self, subjects, actual, possible):
+        """Build lag results from count arrays with one row per subject."""
+        lags = np.arange(-(self.list_length - 1), self.list_length)
+        prob = _divide_counts(actual, possible)
+        crp = pd.DataFrame(
+            {'subject': pd.Index(subjects).repeat(len(lags)),
+             'lag': np.tile(lags, len(subjects)), 'prob': prob.ravel(),
+             'actual': actual.ravel(), 'possible': possible.ravel()}
+        )
         crp = crp.set_index(['subject', 'lag'])
         return crp
 
+    def analyze_subject(self, subject, pool, recall):
+        n_lag = 2 * (int(self.list_length) - 1) + 1
+        actual = np.zeros((1, n_lag), dtype=int)
+        possible = np.zeros((1, n_lag), dtype=int)
+        self._count_subject(pool, recall, actual[0], possible[0])
+        return self._lag_frame([subject], actual, possible)
+
+    def analyze(self, data):
+        # fill count arrays for all subjects, then build one DataFrame
+        grouped = data.groupby('subject')
+        n_lag = 2 * (int(self.list_length) - 1) + 1
+        actual = np.zeros((grouped.ngroups, n_lag), dtype=int)
+        possible = np.zeros((grouped.ngroups, n_lag), dtype=int)
+        subjects = []
+        for i, (subject, subject_data) in enumerate(grouped):
+            pool = self.split_lists(subject_data, 'study')
+            recall = self.split_lists(subject_data, 'recall')
+            self._count_subject(pool, recall, actual[i], possible[i])
+            subjects.append(subject)
+        return self._lag_frame(subjects, actual, possible)
+
 
 class TransitionLagRank(TransitionMeasure):
 
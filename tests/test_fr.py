@@ -62,6 +62,12 @@ def test_filter_merged_data(data):
     assert filt['item'].to_list() == ['hollow', 'pillow']
 
 
+def test_block_index():
+    list_labels = ['a', 'a', 'b', 'b', 'b', 'a', 'c', 'c']
+    block = fr.block_index(list_labels)
+    np.testing.assert_array_equal(block, np.array([1, 1, 2, 2, 2, 3, 4, 4]))
+
+
 def test_split_lists(data):
     study = fr.split_lists(data, 'study', ['item', 'input', 'task'])
     np.testing.assert_allclose(study['input'][1], np.array([1., 2., 3.]))
@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
 from psifr import transitions
+from psifr import _crp_numba
 
 
 class LagCRPTestCase(unittest.TestCase):
@@ -39,3 +40,69 @@ class LagCRPTestCase(unittest.TestCase):
         np.testing.assert_array_equal(
             possible.to_numpy(),
             np.array([0, 0, 0, 0, 1, 1, 3, 0, 2, 1, 1, 0, 0, 0, 0]))
+
+    def test_lag_count_positions(self):
+        pool = [self.pool_position, [1, 2, 3, 5, 6, 7]]
+        recall = [self.output_position, [2, np.nan, 3, 4, 3, 7, 1, 5]]
+
+        # labels are passed explicitly to use the masker
+        expected_actual, expected_possible = transitions.count_lags(
+            self.list_length, pool, recall, pool, recall
+        )
+        for counter in [_crp_numba.count_lags,
+                        transitions._count_position_lags]:
+            actual = np.zeros(15, dtype=int)
+            possible = np.zeros(15, dtype=int)
+            assert counter(self.list_length, pool, recall, actual, possible)
+            np.testing.assert_array_equal(
+                actual, expected_actual.to_numpy())
+            np.testing.assert_array_equal(
+                possible, expected_possible.to_numpy())
+
+    def test_lag_count_positions_test(self):
+        pool = [self.pool_position]
+        recall = [self.output_position]
+        pool_test = [self.pool_category]
+        recall_test = [self.output_category]
+        expected_actual, expected_possible = transitions.count_lags(
+            self.list_length, pool, recall, pool, recall,
+            pool_test, recall_test, lambda x, y: x == y
+        )
+        actual = np.zeros(15, dtype=int)
+        possible = np.zeros(15, dtype=int)
+        assert transitions._count_position_lags(
+            self.list_length, pool, recall, actual, possible,
+            pool_test, recall_test, lambda x, y: x == y
+        )
+        np.testing.assert_array_equal(actual, expected_actual.to_numpy())
+        np.testing.assert_array_equal(possible, expected_possible.to_numpy())
+
+    def test_lag_count_positions_repeated(self):
+        pool = [[1, 2, 2, 3, 4]]
+        recall = [[2, 1, 2, 3]]
+        for counter in [_crp_numba.count_lags,
+                        transitions._count_position_lags]:
+            actual = np.zeros(7, dtype=int)
+            possible = np.zeros(7, dtype=int)
+            assert not counter(4, pool, recall, actual, possible)
+            assert not actual.any() and not possible.any()
+
+        # lists with repeated positions are counted using the masker
+        expected_actual, expected_possible = transitions.count_lags(
+            4, pool, recall, pool, recall
+        )
+        actual, possible = transitions.count_lags(4, pool, recall)
+        np.testing.assert_array_equal(actual, expected_actual)
+        np.testing.assert_array_equal(possible, expected_possible)
+
+    def test_lag_count_out_of_range(self):
+        # lags beyond the list length are excluded from the counts
+        actual, possible = transitions.count_lags(3, [[1, 2, 3, 5]], [[5, 1]])
+        np.testing.assert_array_equal(actual.to_numpy(), [0, 0, 0, 0, 0])
+        np.testing.assert_array_equal(possible.to_numpy(), [1, 0, 0, 0, 0])
+
+        actual, possible = transitions.count_lags(
+            3, [[1, 2, 3, 5]], [[1, 5, 2]]
+        )
+        np.testing.assert_array_equal(actual.to_numpy(), [0, 0, 0, 0, 0])
+        np.testing.assert_array_equal(possible.to_numpy(), [1, 0, 0, 1, 1])
@@ -63,6 +63,47 @@ class MergeTestCase(unittest.TestCase):
         assert repeat['repeat'] == 1
         assert not repeat['intrusion']
 
+    def test_merge_default(self):
+        study = self.data.loc[self.data.trial_type == 'study'].copy()
+        recall = self.data.loc[self.data.trial_type == 'recall'].copy()
+        merged = fr.merge_lists(study, recall)
+
+        # including another column requires a full merge
+        expected = fr.merge_lists(study, recall, study_keys=['trial_type'])
+        expected = expected.drop(columns='trial_type')
+        pd.testing.assert_frame_equal(merged, expected)
+
+    def test_merge_categorical(self):
+        data = self.data.copy()
+        data['subject'] = pd.Categorical(['b'] * 6 + ['a'] * 6,
+                                         categories=['b', 'a'])
+        study = data.loc[data.trial_type == 'study'].copy()
+        recall = data.loc[data.trial_type == 'recall'].copy()
+
+        # subjects are sorted in category order
+        for kwargs in [{}, {'study_keys': ['trial_type']}]:
+            merged = fr.merge_lists(study, recall, **kwargs)
+            np.testing.assert_array_equal(
+                merged['subject'].to_numpy(), ['b'] * 4 + ['a'] * 4
+            )
+            np.testing.assert_array_equal(
+                merged['list'].to_numpy(), [1] * 4 + [2] * 4
+            )
+
+    def test_merge_missing_item(self):
+        data = self.data.copy()
+        data.loc[[3, 5], 'item'] = np.nan
+        study = data.loc[data.trial_type == 'study'].copy()
+        recall = data.loc[data.trial_type == 'recall'].copy()
+
+        # recalls with a missing item are not counted as repeats
+        for kwargs in [{}, {'study_keys': ['trial_type']}]:
+            merged = fr.merge_lists(study, recall, **kwargs)
+            missing = merged.loc[merged['item'].isna()]
+            assert len(missing) == 2
+            assert (missing['repeat'] == 0).all()
+            assert missing['intrusion'].all()
+
 
 if __name__ == '__main__':
     unittest.main()
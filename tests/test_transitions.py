@@ -67,6 +67,17 @@ class TransitionsMaskerTestCase(unittest.TestCase):
                     [2, 2, [2]]]
         assert steps == expected
 
+    def test_repeated_items(self):
+        """Test pool with repeated items."""
+        pool = [1, 2, 2, 3, 4]
+        recall = [2, 1, 2, 3]
+        masker = transitions.transitions_masker(pool, recall, pool, recall)
+        steps = [[x, y, z.tolist()] for x, y, z in masker]
+        expected = [[2, 1, [1, 2, 3, 4]],
+                    [1, 2, [2, 3, 4]],
+                    [2, 3, [3, 4]]]
+        assert steps == expected
+
 
 class TransitionsMeasureTestCase(unittest.TestCase):
 
@@ -108,7 +119,10 @@ class TransitionsMeasureTestCase(unittest.TestCase):
         pool_expected = {'items': [[1.0, 2.0, 3.0], [1.0, 2.0, 3.0]],
                          'label': [[1.0, 2.0, 3.0], [1.0, 2.0, 3.0]],
                          'test': None}
-        assert pool_lists == pool_expected
+        for key in pool_expected.keys():
+            assert key in pool_lists
+            np.testing.assert_array_equal(pool_lists[key],
+                                          pool_expected[key])
 
         recall_lists = m.split_lists(self.data, 'recall')
         recall_expected = {'items': [[2.0, 3.0, np.nan], [3.0, 1.0, 3.0]],